@@ -141,31 +141,18 @@ function ModelMetrics() {
     try {
       setLoadingHistorical(true);
       const modelInfo = deployedModels[selectedModel];
-      const fileList = await modelAPI.getNewMetricsFileNames(modelInfo.model_name, modelInfo.version);
+      const history = await modelAPI.getMetricsHistory(modelInfo.model_name, modelInfo.version);
       
-      // Sort files by timestamp (newest first)
-      const sortedFiles = fileList.files.sort((a, b) => {
-        const timestampA = parseFloat(a.replace('metrics_at_', '').replace('.json', ''));
-        const timestampB = parseFloat(b.replace('metrics_at_', '').replace('.json', ''));
-        return timestampB - timestampA;
-      });
+      // Newest first, downsampled entries have no file name of their own
+      const metricsData = history.series
+        .map((entry) => ({
+          filename: entry.filename || `metrics_at_${entry.timestamp}.json`,
+          metrics: entry.metrics,
+        }))
+        .reverse();
       
-      setHistoricalMetrics(sortedFiles);
-      
-      // Fetch metrics data for comparison
-      const metricsData = await Promise.all(
-        sortedFiles.map(async (filename) => {
-          try {
-            const metrics = await modelAPI.getNewMetricsFile(modelInfo.model_name, modelInfo.version, filename);
-            return { filename, metrics };
-          } catch (err) {
-            console.warn(`Failed to fetch metrics for ${filename}:`, err);
-            return { filename, metrics: null };
-          }
-        })
-      );
-      
-      setHistoricalMetricsData(metricsData.filter(item => item.metrics !== null));
+      setHistoricalMetrics(metricsData.map((item) => item.filename));
+      setHistoricalMetricsData(metricsData);
     } catch (err) {
       console.warn('No historical metrics found or error fetching:', err.message);
       setHistoricalMetrics([]);
@@ -179,6 +166,9 @@ function ModelMetrics() {
     if (!selectedModel || !filename) return null;
     
     try {
+      const loaded = historicalMetricsData.find((item) => item.filename === filename);
+      if (loaded) return loaded.metrics;
+
       const modelInfo = deployedModels[selectedModel];
       const metrics = await modelAPI.getNewMetricsFile(modelInfo.model_name, modelInfo.version, filename);
       return metrics;
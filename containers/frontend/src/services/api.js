@@ -105,6 +105,17 @@ export const modelAPI = {
     return response;
   },
 
+  // Get the whole metrics history of a model in one request, downsampled by the server past maxPoints entries
+  getMetricsHistory: async (modelName, version, startDate = null, endDate = null, maxPoints = null) => {
+    const params = {};
+    if (startDate) params.start_date = startDate;
+    if (endDate) params.end_date = endDate;
+    if (maxPoints) params.max_points = maxPoints;
+
+    const response = await api.get(`/model/${modelName}-${version}/metrics_history`, { params });
+    return response.data;
+  },
+
   // Get list of new metrics files for a model
   getNewMetricsFileNames: async (modelName, version) => {
     const response = await api.get(`/model/${modelName}-${version}/new_metrics_file_name`);
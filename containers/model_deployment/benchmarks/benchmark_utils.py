@@ -0,0 +1,128 @@
+"""
+Helpers shared by the model_deployment benchmarks.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+MODEL_DEPLOYMENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def install_mongomock():
+    """
+    Replace pymongo.MongoClient with mongomock clients sharing one in-memory server, must run before deployments is imported.
+    """
+    import mongomock
+    import pymongo
+    from mongomock.store import ServerStore
+
+    store = ServerStore()
+
+    class SharedMongoClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("_store", store)
+            super().__init__(*args, **kwargs)
+
+    pymongo.MongoClient = SharedMongoClient
+
+def import_deployments(mongo_uri=None):
+    """
+    Import the deployments module against mongomock, or against the MongoDB at mongo_uri.
+    The SQLite database is a temporary one and Uptime Kuma is left alone, so the service state is not touched.
+    """
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="model_deployment_benchmark_"), "model_deployment.db")
+    os.environ["UPTIME_KUMA_URL"] = ""
+    if mongo_uri:
+        os.environ["MONGODB_URI"] = mongo_uri
+        os.environ.pop("MONGODB_USER", None)
+        os.environ.pop("MONGODB_PASSWORD", None)
+    else:
+        install_mongomock()
+    sys.path.insert(0, MODEL_DEPLOYMENT_DIR)
+    import deployments
+    return deployments
+
+def wait_for_http(url, timeout=30):
+    """
+    Wait until url answers with a status below 500.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def summarize_latencies(latencies_ms, seconds, errors=0):
+    """
+    Get the throughput and latency percentiles of a run.
+    """
+    latencies = np.asarray(latencies_ms, dtype=float)
+    if not len(latencies):
+        return {"requests": 0, "errors": errors, "seconds": round(seconds, 3)}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": int(len(latencies)),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 2) if seconds else None,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(latencies.max()), 3)
+    }
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of this process in MB.
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def current_rss_mb():
+    """
+    Get the current resident set size of this process in MB.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=MODEL_DEPLOYMENT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, parameters, results, output=None):
+    """
+    Print the results of a benchmark as JSON, with what is needed to compare runs, and write them to output.
+    """
+    document = {
+        "benchmark": name,
+        "timestamp": time.time(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "parameters": parameters,
+        "results": results
+    }
+    text = json.dumps(document, indent=4)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    return document
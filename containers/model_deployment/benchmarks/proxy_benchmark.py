@@ -0,0 +1,131 @@
+"""
+Load test of proxy_to_model: replays payload files against the stub backend directly and through the proxy,
+and reports the RPS and latency percentiles of both and the overhead of the proxy.
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmark_utils import summarize_latencies, wait_for_http, write_results
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_payloads(patterns):
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))
+    if not paths:
+        raise SystemExit(f"No payload files match {patterns}")
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            # Validate once, the bytes are sent as they are
+            content = f.read()
+            json.loads(content)
+            payloads.append(content)
+    return paths, payloads
+
+async def run_load(url, payloads, concurrency, requests, duration, warmup):
+    """
+    Send the payloads round robin from concurrency workers, until requests are sent or duration seconds have passed.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Content-Type": "application/json"}
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        for payload in itertools.islice(itertools.cycle(payloads), warmup):
+            await client.post(url, content=payload, headers=headers)
+
+        latencies = []
+        errors = 0
+        sent = itertools.count()
+        payload_cycle = itertools.cycle(payloads)
+        started = time.perf_counter()
+        deadline = started + duration if duration else None
+
+        async def worker():
+            nonlocal errors
+            while True:
+                if requests and next(sent) >= requests:
+                    return
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                request_started = time.perf_counter()
+                try:
+                    response = await client.post(url, content=next(payload_cycle), headers=headers)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - request_started) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize_latencies(latencies, time.perf_counter() - started, errors)
+
+def start_process(script, *arguments):
+    return subprocess.Popen([sys.executable, os.path.join(BENCHMARKS_DIR, script), *map(str, arguments)], cwd=BENCHMARKS_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--payloads", nargs="+", default=[os.path.join(BENCHMARKS_DIR, "payloads", "*.json")], help="Payload files or glob patterns")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per target, 0 to only use --duration")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds per target, 0 to only use --requests")
+    parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency of the stub backend")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--backend-port", type=int, default=18001)
+    parser.add_argument("--proxy-port", type=int, default=18000)
+    parser.add_argument("--mongo-uri", help="MongoDB the proxy captures into, mongomock when not given")
+    parser.add_argument("--storage-mode", choices=["raw", "bucketed"], default="raw", help="INPUTED_DATA_STORAGE_MODE of the proxy")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error("--requests or --duration is needed")
+
+    paths, payloads = load_payloads(args.payloads)
+    os.environ["INPUTED_DATA_STORAGE_MODE"] = args.storage_mode
+
+    proxy_arguments = ["--port", args.proxy_port, "--backend-port", args.backend_port]
+    if args.mongo_uri:
+        proxy_arguments += ["--mongo-uri", args.mongo_uri]
+    processes = [
+        start_process("stub_backend.py", "--port", args.backend_port, "--latency-ms", args.latency_ms, "--jitter-ms", args.jitter_ms),
+        start_process("run_proxy.py", *proxy_arguments)
+    ]
+    try:
+        wait_for_http(f"http://127.0.0.1:{args.backend_port}/ping")
+        wait_for_http(f"http://127.0.0.1:{args.proxy_port}/health", timeout=120)
+
+        results = {}
+        for target, url in (
+            ("direct", f"http://127.0.0.1:{args.backend_port}/invocations"),
+            ("proxy", f"http://127.0.0.1:{args.proxy_port}/bench-1/invocations")
+        ):
+            results[target] = asyncio.run(run_load(url, payloads, args.concurrency, args.requests, args.duration, args.warmup))
+
+        if results["direct"]["requests"] and results["proxy"]["requests"]:
+            results["proxy_overhead"] = {
+                key: round(results["proxy"][key] - results["direct"][key], 3)
+                for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+            }
+            results["proxy_overhead"]["rps_ratio"] = round(results["proxy"]["rps"] / results["direct"]["rps"], 3)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "payloads")}
+    parameters["payloads"] = [os.path.basename(path) for path in paths]
+    write_results("proxy", parameters, results, args.output)
+
+if __name__ == "__main__":
+    main()
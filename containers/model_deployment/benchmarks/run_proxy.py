@@ -0,0 +1,39 @@
+"""
+Run the model_deployment API for the benchmarks, with a model key routed to the stub backend.
+"""
+import argparse
+import os
+
+import uvicorn
+
+from benchmark_utils import import_deployments
+
+async def skip_model_server_restore():
+    pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--backend-port", type=int, default=18001)
+    parser.add_argument("--model-key", default="bench-1", help="{model_name}-{version} routed to the stub backend")
+    parser.add_argument("--mongo-uri", help="MongoDB to capture into, mongomock when not given")
+    args = parser.parse_args()
+
+    # No compaction loop, it would compact the captured data of every model of --mongo-uri
+    os.environ["INPUTED_DATA_RETENTION_DAYS"] = "0"
+    deployments = import_deployments(args.mongo_uri)
+    model_name, version = args.model_key.split("-", 1)
+    # Only in memory, the temporary SQLite database of the benchmark stays empty
+    deployments.deployed_models[args.model_key] = {
+        "model_name": model_name,
+        "version": version,
+        "port": args.backend_port,
+        "run_uuid": "benchmark"
+    }
+    # The stub backend stands in for the model server, there is nothing to restore
+    deployments._reload_deployed_models = skip_model_server_restore
+    deployments.ready_models.add(args.model_key)
+    uvicorn.run(deployments.app, host="127.0.0.1", port=args.port, log_level="warning", workers=1)
+
+if __name__ == "__main__":
+    main()
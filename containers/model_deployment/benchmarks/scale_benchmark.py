@@ -0,0 +1,232 @@
+"""
+Scale benchmark of the dataset export and the degradation reports: fills MongoDB with synthetic captured
+invocations shaped like examples/WineQT.csv, then times get_dataset in every format and the degradation report
+in every mode at each volume, with the peak memory of every stage.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmark_utils import current_rss_mb, import_deployments, peak_rss_mb, write_results
+
+MODEL_NAME = "scalebench"
+VERSION = "1"
+
+# Mean, standard deviation, minimum and maximum of the feature columns of examples/WineQT.csv
+WINEQT_COLUMNS = {
+    "fixed acidity": (8.311, 1.748, 4.6, 15.9),
+    "volatile acidity": (0.5313, 0.1796, 0.12, 1.58),
+    "citric acid": (0.2684, 0.1967, 0.0, 1.0),
+    "residual sugar": (2.532, 1.356, 0.9, 15.5),
+    "chlorides": (0.08693, 0.04727, 0.012, 0.611),
+    "free sulfur dioxide": (15.62, 10.25, 1.0, 68.0),
+    "total sulfur dioxide": (45.91, 32.78, 6.0, 289.0),
+    "density": (0.9967, 0.001925, 0.9901, 1.004),
+    "pH": (3.311, 0.1567, 2.74, 4.01),
+    "sulphates": (0.6577, 0.1704, 0.33, 2.0),
+    "alcohol": (10.44, 1.082, 8.4, 14.9),
+}
+# quality goes from 3 to 8
+WINEQT_CLASSES = [3, 4, 5, 6, 7, 8]
+WINEQT_CLASS_WEIGHTS = [0.005, 0.029, 0.424, 0.405, 0.125, 0.012]
+
+INSERT_BATCH_DOCUMENTS = 1000
+TRAINING_ROWS = 1143
+
+def synthetic_frame(rows, rng, shift=0.0):
+    """
+    Draw rows with the per-column distribution of WineQT, every mean moved by shift standard deviations.
+    """
+    return pd.DataFrame({
+        column: np.clip(rng.normal(mean + shift * std, std, rows), low, high).round(5)
+        for column, (mean, std, low, high) in WINEQT_COLUMNS.items()
+    })
+
+def create_initial_report(deployments, seed):
+    """
+    Build the initial report of the benchmark model from a synthetic training dataset, as deploy does.
+    """
+    model_path = f"/app/models/{MODEL_NAME}-{VERSION}"
+    shutil.rmtree(model_path, ignore_errors=True)
+    dataset_path = f"{model_path}/initial_report/data/dataset.csv"
+    os.makedirs(os.path.dirname(dataset_path))
+    synthetic_frame(TRAINING_ROWS, np.random.default_rng(seed)).to_csv(dataset_path, index=False)
+
+    started = time.perf_counter()
+    deployments._create_initial_report(dataset_path, {"accuracy": 0.65}, f"{model_path}/initial_report", len(WINEQT_CLASSES))
+    return round(time.perf_counter() - started, 3)
+
+def fill_inputed_data(deployments, db, first_row, rows, rows_per_invocation, days, shift, rng):
+    """
+    Insert rows captured as raw inputed_data documents, spread evenly over the last days, oldest first.
+    The feature statistics are accumulated as the proxy does, so incremental reports have them.
+    """
+    invocations = -(-rows // rows_per_invocation)
+    now = datetime.utcnow()
+    offsets = np.linspace(days * 86400, 0, invocations, endpoint=False)
+    inserted = 0
+    started = time.perf_counter()
+    for batch_start in range(0, invocations, INSERT_BATCH_DOCUMENTS):
+        batch_offsets = offsets[batch_start:batch_start + INSERT_BATCH_DOCUMENTS]
+        batch_rows = min(len(batch_offsets) * rows_per_invocation, rows - inserted)
+        records = synthetic_frame(batch_rows, rng, shift).to_dict("records")
+        predictions = rng.choice(WINEQT_CLASSES, batch_rows, p=WINEQT_CLASS_WEIGHTS).tolist()
+
+        documents = []
+        for i, offset in enumerate(batch_offsets):
+            instances = records[i * rows_per_invocation:(i + 1) * rows_per_invocation]
+            documents.append({
+                "model_name": MODEL_NAME,
+                "version": VERSION,
+                "data": {"instances": instances},
+                "timestamp": now - timedelta(seconds=float(offset)),
+                "request_id": f"scalebench-{first_row + inserted}",
+                "predictions": predictions[i * rows_per_invocation:(i + 1) * rows_per_invocation],
+                "status_code": 200,
+                "latency_ms": 5.0,
+                "sampling": {"policy": "all"}
+            })
+            inserted += len(instances)
+        db.inputed_data.insert_many(documents, ordered=False)
+        deployments._accumulate_feature_stats(MODEL_NAME, VERSION, records)
+
+    deployments._flush_feature_stats()
+    return {"rows": inserted, "invocations": invocations, "seconds": round(time.perf_counter() - started, 3)}
+
+def clear_model_data(db):
+    query = {"model_name": MODEL_NAME, "version": VERSION}
+    for collection in ("inputed_data", "inputed_data_buckets", "inputed_data_summaries", "feature_stats", "cluster_accumulators"):
+        db[collection].delete_many(query)
+    db.degradation_state.delete_many({"_id": f"{MODEL_NAME}-{VERSION}"})
+    db.retention_state.delete_many({"_id": f"{MODEL_NAME}-{VERSION}"})
+
+def _measure(stage, *arguments):
+    """
+    Run a stage in this process and return its results with its duration and memory.
+    """
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    results = stage(*arguments)
+    seconds = time.perf_counter() - started
+    peak = peak_rss_mb()
+    return {
+        "seconds": round(seconds, 3),
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak,
+        "peak_rss_increase_mb": round(peak - rss_before, 1),
+        **results
+    }
+
+def run_stage(stage, *arguments):
+    """
+    Run a stage in a forked child, so its peak RSS is not hidden by the stages measured before it.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+        try:
+            return executor.submit(_measure, stage, *arguments).result()
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+def export_dataset(export_format):
+    """
+    Download the whole dataset through get_dataset, as a client would.
+    """
+    from fastapi.testclient import TestClient
+    import deployments
+
+    first_byte = None
+    size = 0
+    started = time.perf_counter()
+    # Without the context manager the startup hooks of the API are not run
+    client = TestClient(deployments.app)
+    with client.stream("GET", f"/model/{MODEL_NAME}-{VERSION}/dataset", params={"format": export_format}) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(chunk)
+    return {"bytes": size, "first_byte_seconds": round(first_byte or 0, 3)}
+
+def generate_report(mode):
+    """
+    Build the degradation report as the report workers do, from an empty incremental state.
+    """
+    import deployments
+
+    client, db = deployments._get_mongo_database()
+    try:
+        # Otherwise a second incremental run would only find the rows captured since the first one
+        db.degradation_state.delete_many({"_id": f"{MODEL_NAME}-{VERSION}"})
+        db.cluster_accumulators.delete_many({"model_name": MODEL_NAME, "version": VERSION})
+    finally:
+        client.close()
+
+    report_path = deployments._degradation_report_path(MODEL_NAME, VERSION, mode)
+    deployments._generate_degradation_report(MODEL_NAME, VERSION, report_path, mode)
+    size = sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _directories, names in os.walk(report_path) for name in names
+    )
+    shutil.rmtree(report_path, ignore_errors=True)
+    return {"bytes": size}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Captured rows to measure at, filled incrementally")
+    parser.add_argument("--rows-per-invocation", type=int, default=1, help="Instances in every captured invocation")
+    parser.add_argument("--days", type=float, default=400, help="Days the capture timestamps are spread over, the report windows go up to a year")
+    parser.add_argument("--shift", type=float, default=0.5, help="Standard deviations the captured data drifts from the training data")
+    parser.add_argument("--formats", default="csv,parquet,arrow", help="Export formats to time, empty to skip the export")
+    parser.add_argument("--report-modes", default="full,incremental", help="Report modes to time, empty to skip the reports")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri", help="MongoDB to fill, mongomock when not given (a real MongoDB is needed for millions of rows)")
+    parser.add_argument("--keep", action="store_true", help="Keep the captured data and the initial report of the benchmark model")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    formats = [export_format for export_format in args.formats.split(",") if export_format]
+    modes = [mode for mode in args.report_modes.split(",") if mode]
+    deployments = import_deployments(args.mongo_uri)
+    unknown = [f for f in formats if f not in deployments.DATASET_EXPORT_FORMATS] + [m for m in modes if m not in deployments.DEGRADATION_REPORT_MODES]
+    if unknown:
+        parser.error(f"Unknown formats or report modes {unknown}")
+
+    # The SQLite schema and the indexes are created by the startup of the API, which the benchmark does not run
+    deployments._init_database()
+    deployments._ensure_mongo_schema()
+    rng = np.random.default_rng(args.seed)
+    client, db = deployments._get_mongo_database()
+    results = {"initial_report_seconds": create_initial_report(deployments, args.seed), "volumes": []}
+    clear_model_data(db)
+    try:
+        filled = 0
+        for rows in sorted(set(args.rows)):
+            fill = fill_inputed_data(deployments, db, filled, rows - filled, args.rows_per_invocation, args.days, args.shift, rng)
+            filled = rows
+            volume = {
+                "rows": rows,
+                "fill": fill,
+                "export": {export_format: run_stage(export_dataset, export_format) for export_format in formats},
+                "report": {mode: run_stage(generate_report, mode) for mode in modes}
+            }
+            results["volumes"].append(volume)
+            print(f"{rows} rows: {volume}", flush=True)
+    finally:
+        if not args.keep:
+            clear_model_data(db)
+            shutil.rmtree(f"/app/models/{MODEL_NAME}-{VERSION}", ignore_errors=True)
+        client.close()
+
+    parameters = {key: value for key, value in vars(args).items() if key != "output"}
+    parameters["storage_mode"] = deployments.INPUTED_DATA_STORAGE_MODE
+    write_results("scale", parameters, results, args.output)
+
+if __name__ == "__main__":
+    main()
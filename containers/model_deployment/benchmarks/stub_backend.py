@@ -0,0 +1,43 @@
+"""
+Stand-in for mlflow models serve: answers /invocations with one prediction per instance after a configurable latency.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+app = FastAPI()
+settings = {"latency_ms": 5.0, "jitter_ms": 0.0, "per_row_ms": 0.0, "prediction": 5}
+
+@app.get("/ping")
+@app.get("/health")
+async def ping():
+    return Response(content="\n", status_code=200)
+
+@app.post("/invocations")
+async def invocations(request: Request):
+    body = json.loads(await request.body())
+    instances = body.get("instances") or body.get("inputs") or body.get("dataframe_records") or []
+    if isinstance(body.get("dataframe_split"), dict):
+        instances = body["dataframe_split"].get("data", [])
+
+    delay_ms = settings["latency_ms"] + settings["per_row_ms"] * len(instances) + random.uniform(0, settings["jitter_ms"])
+    await asyncio.sleep(delay_ms / 1000)
+    return {"predictions": [settings["prediction"]] * len(instances)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency of every invocation")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random latency added on top, uniform between 0 and this")
+    parser.add_argument("--per-row-ms", type=float, default=0.0, help="Latency added for every instance")
+    args = parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_row_ms=args.per_row_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
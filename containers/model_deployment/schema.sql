@@ -4,4 +4,31 @@ CREATE TABLE IF NOT EXISTS model_deployment (
     model_version text NOT NULL,
     port int NOT NULL,
     run_uuid text NOT NULL
-)
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS capture_policy (
+    id text PRIMARY KEY,
+    policy text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS metrics_history (
+    id integer PRIMARY KEY AUTOINCREMENT,
+    model_id text NOT NULL,
+    timestamp real NOT NULL,
+    metrics text NOT NULL,
+    confidence_intervals text
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS metrics_history_model_timestamp ON metrics_history (model_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS metric_values (
+    history_id integer NOT NULL,
+    model_id text NOT NULL,
+    timestamp real NOT NULL,
+    metric text NOT NULL,
+    value real NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS metric_values_model_timestamp ON metric_values (model_id, timestamp);
+
+CREATE INDEX IF NOT EXISTS metric_values_history ON metric_values (history_id);
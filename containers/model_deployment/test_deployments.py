@@ -0,0 +1,852 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import zipfile
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import HTTPException, Request
+
+import deployments
+
+
+def test_parse_timestamp_range():
+    assert deployments._parse_timestamp_range("2024-01-01", "2024-01-31") == {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 2, 1)}
+    assert deployments._parse_timestamp_range("2024-01-01", "2024-01-31T12:00:00") == {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 1, 31, 12)}
+    with pytest.raises(ValueError):
+        deployments._parse_timestamp_range("2024-01-01", "yesterday")
+
+
+class _MigrationCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.batches = []
+
+    def find(self, query, projection):
+        found = [doc for doc in self.documents if isinstance(doc["timestamp"], (int, float))]
+        return type("Cursor", (), {"limit": lambda cursor, size: found[:size]})()
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+        by_id = {doc["_id"]: doc for doc in self.documents}
+        for operation in operations:
+            by_id[operation._filter["_id"]].update(operation._doc["$set"])
+
+
+def test_float_timestamps_are_migrated_in_batches(monkeypatch):
+    pytest.importorskip("pymongo")
+    monkeypatch.setattr(deployments, "MONGO_MIGRATION_BATCH_SIZE", 2)
+    documents = [{"_id": i, "timestamp": 86400.0 * i} for i in range(3)] + [{"_id": 3, "timestamp": datetime(2024, 1, 1)}]
+    db = type("Database", (), {"inputed_data": _MigrationCollection(documents)})()
+
+    assert deployments._migrate_float_timestamps(db) == 3
+    assert db.inputed_data.batches == [2, 1]
+    assert [doc["timestamp"] for doc in documents] == [datetime(1970, 1, 1), datetime(1970, 1, 2), datetime(1970, 1, 3), datetime(2024, 1, 1)]
+
+
+def test_row_as_features():
+    assert deployments._row_as_features({"a": 1}) == {"a": 1}
+    assert deployments._row_as_features([1, 2]) == {"0": 1, "1": 2}
+    assert deployments._row_as_features(3) is None
+
+
+def test_bucket_bounds(monkeypatch):
+    monkeypatch.setattr(deployments, "INPUTED_DATA_BUCKET_SECONDS", 3600)
+
+    assert deployments._bucket_bounds(datetime(2024, 1, 1, 10, 30)) == (datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 11))
+
+
+def test_bucket_to_batch():
+    bucket = {
+        "features": ["a", "b"],
+        "columns": {"a": [1, 2, 3], "b": ["x", "y", "z"]},
+        "timestamps": [datetime(2024, 1, 1, 10, minute) for minute in (0, 10, 20)],
+        "sample_weights": [1.0, 2.0, 4.0],
+    }
+
+    df, timestamps, weights = deployments._bucket_to_batch(bucket, {"$gte": datetime(2024, 1, 1, 10, 5), "$lt": datetime(2024, 1, 1, 10, 20)})
+
+    assert df.to_dict("records") == [{"a": 2, "b": "y"}]
+    assert timestamps.tolist() == [datetime(2024, 1, 1, 10, 10)]
+    assert weights.tolist() == [2.0]
+
+
+def test_bucket_to_batch_without_weights():
+    bucket = {"features": ["a"], "columns": {"a": [1, 2]}, "timestamps": [datetime(2024, 1, 1)] * 2}
+
+    _df, _timestamps, weights = deployments._bucket_to_batch(bucket)
+
+    assert np.array_equal(weights, [1.0, 1.0])
+
+
+class _RecordingCollection:
+    def __init__(self):
+        self.updates = []
+
+    def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update))
+
+
+def test_buckets_of_colliding_feature_names_are_kept_apart(monkeypatch):
+    monkeypatch.setattr(deployments, "INPUTED_DATA_BUCKET_MAX_ROWS", 10)
+    buckets = _RecordingCollection()
+    db = type("Database", (), {"inputed_data_buckets": buckets})()
+    capture = {"predictions": [0, 1, 1], "request_id": "id", "latency_ms": 1.0, "sampling": {"sample_weight": 1.0}}
+
+    assert deployments._save_instances_to_bucket(db, "model", "1", [{"a|b": 1}, {"a": 1, "b": 2}, {"a": 3, "b": 4}], datetime(2024, 1, 1), capture)
+
+    (joined, _), (split, update) = buckets.updates
+    assert joined["schema"] != split["schema"]
+    assert split["$expr"] == {"$lte": [{"$size": {"$ifNull": ["$timestamps", []]}}, 8]}
+    assert update["$push"]["columns.a"] == {"$each": [1, 3]}
+
+
+def test_instances_with_unstorable_feature_names_are_not_bucketed():
+    db = type("Database", (), {"inputed_data_buckets": _RecordingCollection()})()
+
+    assert not deployments._save_instances_to_bucket(db, "model", "1", [{"a.b": 1}], datetime(2024, 1, 1), {"predictions": None})
+    assert db.inputed_data_buckets.updates == []
+
+
+def test_validate_capture_policy():
+    assert deployments._validate_capture_policy({"type": "rate", "rate": "0.5"}) == {"type": "rate", "rate": 0.5}
+    assert deployments._validate_capture_policy({"type": "reservoir"}) == {"type": "reservoir", "size": 1000, "window_seconds": 3600}
+    for policy in ({"type": "rate", "rate": 0}, {"type": "stratified", "rates": {"a": 2}}, {"type": "unknown"}):
+        with pytest.raises(ValueError):
+            deployments._validate_capture_policy(policy)
+
+
+def test_sampling_decision_weights(monkeypatch):
+    monkeypatch.setattr(deployments, "capture_policies", {
+        "rate-1": {"type": "rate", "rate": 0.25},
+        "stratified-1": {"type": "stratified", "rates": {"rare": 0.5, "common": 0.1}, "default_rate": 0.2},
+    })
+    monkeypatch.setattr(deployments.random, "random", lambda: 0.05)
+
+    assert deployments._sampling_decision("all-1", [1]) == {"policy": "all", "sample_weight": 1.0}
+    assert deployments._sampling_decision("rate-1", [1])["sample_weight"] == 4.0
+    # The highest rate among the predicted classes is used
+    assert deployments._sampling_decision("stratified-1", ["common", "rare"])["sample_weight"] == 2.0
+    assert deployments._sampling_decision("stratified-1", "other")["sample_weight"] == 5.0
+
+    monkeypatch.setattr(deployments.random, "random", lambda: 0.3)
+    assert deployments._sampling_decision("rate-1", [1]) is None
+    assert deployments._sampling_decision("stratified-1", ["common"]) is None
+
+
+def test_document_sample_weight():
+    reservoir_weights = {"model-1@0": 7.5}
+
+    assert deployments._document_sample_weight({}, reservoir_weights) == 1.0
+    assert deployments._document_sample_weight({"sampling": {"sample_weight": 4.0}}, reservoir_weights) == 4.0
+    assert deployments._document_sample_weight({"sampling": {"window": "model-1@0", "slot": 0}}, reservoir_weights) == 7.5
+
+
+def test_sample_day_rows():
+    batches = [
+        (pd.DataFrame({"a": np.arange(start, start + 100)}), None, np.full(100, weight))
+        for start, weight in ((0, 1.0), (100, 2.0), (200, 4.0))
+    ]
+
+    rows, features, sample_rows, sample_weights = deployments._sample_day_rows(iter(batches), 50, np.random.default_rng(0))
+
+    assert rows == 300
+    assert features[0]["count"] == 300
+    assert features[0]["mean"] == pytest.approx(149.5)
+    sampled = [row["a"] for row in sample_rows]
+    assert len(set(sampled)) == 50
+    assert sampled == sorted(sampled)
+    # Every sampled row keeps the weight of its batch
+    assert sample_weights.tolist() == [1.0 if a < 100 else 2.0 if a < 200 else 4.0 for a in sampled]
+
+
+def test_class_histogram_is_weighted():
+    assert deployments._class_histogram([(1, 2.0), (0, 1.0), (1, 0.5)]) == [["1", 2.5], ["0", 1.0]]
+    assert deployments._class_histogram([([1, 2], 1.0)]) is None
+
+
+def test_class_histogram_of_regression_outputs(monkeypatch):
+    monkeypatch.setattr(deployments, "SUMMARY_MAX_CLASSES", 3)
+
+    assert deployments._class_histogram((value / 10, 1.0) for value in range(10)) is None
+
+
+def test_compress_centroids_keeps_the_weight():
+    values = np.random.default_rng(0).normal(size=10_000)
+
+    centroids = deployments._compress_centroids(np.column_stack([values, np.ones(len(values))]))
+
+    assert len(centroids) < 2 * deployments.TDIGEST_COMPRESSION
+    assert sum(weight for _mean, weight in centroids) == pytest.approx(len(values))
+    assert sum(mean * weight for mean, weight in centroids) == pytest.approx(values.sum())
+
+
+def test_merged_numeric_stats_match_the_whole():
+    values = np.random.default_rng(0).exponential(size=20_000)
+
+    merged = None
+    for part in np.array_split(values, 7):
+        merged = deployments._merge_feature_stats(merged, deployments._numeric_stats(part))
+    description = deployments._describe_feature_stats(merged)
+
+    assert merged["count"] == len(values)
+    assert description["mean"] == pytest.approx(values.mean())
+    assert description["variance"] == pytest.approx(values.var(ddof=1))
+    assert (description["min"], description["max"]) == (values.min(), values.max())
+    for q in (0.05, 0.5, 0.95):
+        assert description["quantiles"][f"p{int(q * 100):02d}"] == pytest.approx(np.quantile(values, q), rel=0.02)
+
+
+def test_merged_categorical_stats_are_capped(monkeypatch):
+    monkeypatch.setattr(deployments, "CATEGORICAL_MAX_VALUES", 3)
+
+    merged = deployments._merge_feature_stats(
+        deployments._categorical_stats(["a", "a", "b"]),
+        deployments._categorical_stats(["a", "c", "d", "e"])
+    )
+
+    assert merged["count"] == 7
+    assert dict(merged["frequencies"]) == {"a": 3, "b": 1, deployments.CATEGORICAL_OTHER: 3}
+
+
+def test_merged_stats_of_a_feature_that_changed_kind():
+    numeric = deployments._numeric_stats([1.0, 2.0, 3.0])
+    categorical = deployments._categorical_stats(["x"])
+
+    assert deployments._merge_feature_stats(numeric, categorical) is numeric
+    assert deployments._merge_feature_stats(None, categorical) is categorical
+
+
+class _PendingExecutor:
+    """
+    Executor whose jobs only finish when the test sets their result.
+    """
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, *args):
+        future = Future()
+        self.submitted.append((args, future))
+        return future
+
+
+@pytest.fixture
+def report_executor(monkeypatch):
+    executor = _PendingExecutor()
+    monkeypatch.setattr(deployments, "report_executor", executor)
+    monkeypatch.setattr(deployments, "report_jobs", {})
+    monkeypatch.setattr(deployments, "report_jobs_by_id", {})
+    return executor
+
+
+def test_submit_report_job_reuses_the_running_job_of_the_mode(report_executor):
+    full = deployments._submit_report_job("model", "1", "/reports/full", "full")
+    incremental = deployments._submit_report_job("model", "1", "/reports/incremental", "incremental")
+
+    assert deployments._submit_report_job("model", "1", "/reports/full", "full") is full
+    assert deployments._submit_report_job("model", "1", "/reports/incremental", "incremental") is incremental
+    assert incremental["id"] != full["id"]
+    assert [args for args, _future in report_executor.submitted] == [
+        ("model", "1", "/reports/full", "full"),
+        ("model", "1", "/reports/incremental", "incremental"),
+    ]
+
+
+def test_submit_report_job_after_the_job_finished(report_executor):
+    job = deployments._submit_report_job("model", "1", "/reports/full")
+    report_executor.submitted[0][1].set_result("/reports/full")
+
+    assert job["status"] == "done"
+    assert deployments._submit_report_job("model", "1", "/reports/full") is not job
+    assert deployments.report_jobs_by_id[job["id"]] is job
+
+
+def test_finished_report_jobs_are_evicted(report_executor, monkeypatch):
+    job = deployments._submit_report_job("model", "1", "/reports/full")
+    report_executor.submitted[0][1].set_exception(RuntimeError("no data"))
+    assert (job["status"], job["error"]) == ("failed", "no data")
+
+    monkeypatch.setattr(deployments, "REPORT_JOB_TTL_SECONDS", -1)
+    deployments._evict_report_jobs()
+
+    assert deployments.report_jobs == {}
+    assert deployments.report_jobs_by_id == {}
+
+
+def test_regenerate_flushes_the_buffers_before_submitting(report_executor, monkeypatch):
+    calls = []
+    monkeypatch.setattr(deployments, "deployed_models", {"model-1": {"model_name": "model", "version": "1"}})
+    monkeypatch.setattr(deployments, "_flush_feature_stats", lambda: calls.append("feature_stats"))
+    monkeypatch.setattr(deployments, "_flush_reservoirs", lambda: calls.append("reservoirs"))
+
+    def report_path(model_name, version, mode):
+        calls.append("report_path")
+        return f"/reports/{mode}"
+    monkeypatch.setattr(deployments, "_degradation_report_path", report_path)
+
+    request = Request({"type": "http", "query_string": b"", "headers": []})
+    job = asyncio.run(deployments.regenerate_degradation_report("model", "1", request))
+
+    assert calls == ["feature_stats", "reservoirs", "report_path"]
+    assert job["report_path"] == f"/reports/{deployments.DEGRADATION_REPORT_MODE}"
+
+
+def test_cluster_accumulators_merge_like_one_pass():
+    rng = np.random.default_rng(0)
+    centroids = np.array([[0.0, 0.0], [5.0, 5.0], [0.0, 5.0]])
+    values = np.concatenate([centroid + rng.normal(size=(50, 2)) for centroid in centroids])
+    weights = rng.uniform(1, 3, size=len(values))
+
+    whole = deployments._accumulate_clusters(deployments._empty_cluster_accumulator(3, 2), values, centroids, weights)
+    merged = deployments._empty_cluster_accumulator(3, 2)
+    for part in np.array_split(np.arange(len(values)), 4):
+        part_accumulator = deployments._accumulate_clusters(deployments._empty_cluster_accumulator(3, 2), values[part], centroids, weights[part])
+        merged = deployments._merge_cluster_accumulators(merged, part_accumulator)
+
+    for key in ("count", "sum", "radius"):
+        assert np.allclose(merged[key], whole[key])
+    assert merged["silhouette_sum"] == pytest.approx(whole["silhouette_sum"])
+    assert sum(whole["count"]) == pytest.approx(weights.sum())
+
+
+def test_unweighted_cluster_accumulator():
+    centroids = np.array([[0.0], [10.0]])
+
+    accumulator = deployments._accumulate_clusters(deployments._empty_cluster_accumulator(2, 1), np.array([[1.0], [2.0], [9.0]]), centroids)
+
+    assert accumulator["count"] == [2.0, 1.0]
+    assert accumulator["sum"] == [[3.0], [9.0]]
+    assert accumulator["radius"] == [2.0, 1.0]
+
+
+def _body(response):
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(read())
+
+
+def _request(headers=None):
+    return Request({"type": "http", "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]})
+
+
+@pytest.fixture
+def report_directory(tmp_path):
+    (tmp_path / "clusters").mkdir()
+    (tmp_path / "clusters" / "b.json").write_text('{"b": 1}')
+    (tmp_path / "clusters" / "a.json").write_text('{"a": 1}')
+    (tmp_path / "plot.png").write_bytes(b"png")
+    return tmp_path
+
+
+def test_report_files(report_directory):
+    assert [arcname for _path, arcname in deployments._report_files(report_directory, "report")] == [
+        "report/plot.png", "report/clusters/a.json", "report/clusters/b.json"
+    ]
+    assert deployments._report_files(report_directory, "report", suffixes=(".json",), recursive=False) == []
+
+
+def test_zip_response_streams_the_files(report_directory):
+    files = deployments._report_files(report_directory, "report")
+
+    response = deployments._zip_response(_request(), files, "report.zip", {"X-Report-Stale": "false"})
+    assert response.headers["X-Report-Stale"] == "false"
+    assert response.headers["Content-Disposition"] == "attachment; filename=report.zip"
+
+    with zipfile.ZipFile(io.BytesIO(_body(response))) as archive:
+        assert archive.read("report/clusters/a.json") == b'{"a": 1}'
+        assert archive.getinfo("report/plot.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("report/clusters/b.json").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_zip_response_etag(report_directory):
+    files = deployments._report_files(report_directory, "report")
+    response = deployments._zip_response(_request(), files, "report.zip")
+    etag = response.headers["ETag"]
+    _body(response)
+
+    not_modified = deployments._zip_response(_request({"If-None-Match": f'"other", {etag}'}), files, "report.zip")
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+    (report_directory / "clusters" / "a.json").write_text('{"a": 22}')
+    modified = deployments._zip_response(_request({"If-None-Match": etag}), files, "report.zip")
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != etag
+    _body(modified)
+
+
+def test_drain_model_server(monkeypatch):
+    monkeypatch.setattr(deployments, "inflight_requests", {8001: 1})
+
+    async def drain():
+        task = asyncio.create_task(deployments._drain_model_server(8001, timeout=5))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        deployments.inflight_requests[8001] = 0
+        return await task
+
+    assert asyncio.run(drain())
+    deployments.inflight_requests[8001] = 1
+    assert not asyncio.run(deployments._drain_model_server(8001, timeout=0.2))
+
+
+@pytest.fixture
+def deployed_model(monkeypatch):
+    monkeypatch.setattr(deployments, "deployment_locks", {})
+    monkeypatch.setattr(deployments, "deployed_models", {"model-1": {"model_name": "model", "version": "1", "port": 8001, "run_uuid": "run"}})
+    return "model-1"
+
+
+def test_redeploy_conflicts_with_a_deployment_in_progress(deployed_model):
+    async def redeploy():
+        async with deployments._deployment_lock(deployed_model):
+            await deployments.redeploy("model", "1")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(redeploy())
+    assert error.value.status_code == 409
+
+
+def test_undeploy_waits_for_a_redeploy_in_progress(deployed_model, monkeypatch):
+    undeployed = []
+    monkeypatch.setattr(deployments, "_undeploy_model", undeployed.append)
+
+    async def undeploy():
+        lock = deployments._deployment_lock(deployed_model)
+        await lock.acquire()
+        task = asyncio.create_task(deployments.undeploy(deployed_model))
+        await asyncio.sleep(0.1)
+        assert not task.done() and undeployed == []
+        lock.release()
+        return await task
+
+    assert asyncio.run(undeploy()) == {"message": "Model model-1 undeployed"}
+    assert undeployed == [deployed_model]
+
+
+def test_metrics_file_timestamp():
+    assert deployments._metrics_file_timestamp("metrics_at_1714521600.5.json") == 1714521600.5
+    assert deployments._metrics_file_timestamp("metrics_at_2024-05-01.json") == 1714521600.0
+    assert deployments._metrics_file_timestamp("metrics_at_2024-05-01T02:00:00+02:00.json") == 1714521600.0
+    with pytest.raises(ValueError):
+        deployments._metrics_file_timestamp("metrics_at_yesterday.json")
+
+
+def test_legacy_metrics_take_the_square_root():
+    assert deployments._legacy_metrics({"rmse": 4.0, "rmsle": 0.25, "mse": 4.0, "accuracy": 0.5}) == {"rmse": 2.0, "rmsle": 0.5, "mse": 4.0, "accuracy": 0.5}
+
+
+@pytest.fixture
+def metrics_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(deployments, "DATABASE_PATH", str(tmp_path / "model_deployment.db"))
+    deployments._init_database()
+    conn = deployments._get_db_connection()
+    for timestamp in range(100):
+        deployments._save_metrics(conn, "model", "1", float(timestamp), {"accuracy": timestamp / 100, "cm": [[1, 0], [0, 1]]})
+    conn.commit()
+    conn.close()
+
+
+def test_metrics_history(metrics_database):
+    series, downsampled = deployments._load_metrics_history("model", "1", start=10, end=20, end_operator="<")
+
+    assert not downsampled
+    assert [entry["timestamp"] for entry in series] == list(range(10, 20))
+    assert series[0]["metrics"] == {"accuracy": 0.1, "cm": [[1, 0], [0, 1]]}
+
+
+def test_metrics_history_is_downsampled_past_max_points(metrics_database):
+    series, downsampled = deployments._load_metrics_history("model", "1", max_points=10)
+
+    assert downsampled
+    assert len(series) == 10
+    assert sum(bucket["count"] for bucket in series) == 100
+    assert series[0]["metrics"]["accuracy"] == pytest.approx(np.mean(np.arange(10) / 100), abs=0.01)
+    assert "cm" not in series[0]["metrics"]
+
+
+CLASSIFICATION_METRICS = ["accuracy", "balanced_accuracy", "f1", "precision", "recall", "jaccard", "kappa", "mcc", "zero_one_loss"]
+REGRESSION_METRICS = ["mse", "rmse", "msle", "rmsle", "mae", "medae", "mape", "explained_variance", "r2", "max_error"]
+SKLEARN_METRICS = {
+    "accuracy": "accuracy_score", "balanced_accuracy": "balanced_accuracy_score", "f1": "f1_score",
+    "precision": "precision_score", "recall": "recall_score", "jaccard": "jaccard_score", "kappa": "cohen_kappa_score",
+    "mcc": "matthews_corrcoef", "zero_one_loss": "zero_one_loss", "mse": "mean_squared_error",
+    "rmse": "root_mean_squared_error", "msle": "mean_squared_log_error", "rmsle": "root_mean_squared_log_error",
+    "mae": "mean_absolute_error", "medae": "median_absolute_error", "mape": "mean_absolute_percentage_error",
+    "explained_variance": "explained_variance_score", "r2": "r2_score", "max_error": "max_error",
+}
+
+
+def _sklearn_metrics(metric_names, expected, obtained):
+    sk_metrics = pytest.importorskip("sklearn.metrics")
+    results = {}
+    for name in metric_names:
+        try:
+            results[name] = float(getattr(sk_metrics, SKLEARN_METRICS[name])(expected, obtained))
+        except ValueError:
+            pass
+    return results
+
+
+def _classification_inputs(labels, rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    expected = rng.choice(labels, size=rows)
+    # Mostly right, so the metrics are not all near chance
+    obtained = np.where(rng.random(rows) < 0.7, expected, rng.choice(labels, size=rows))
+    return expected, obtained
+
+
+@pytest.mark.parametrize("labels", [[0, 1], [0, 1, 2, 3], [-1, 1], [2, 3], ["a", "b"]], ids=["binary", "multiclass", "pos_label", "no_pos_label", "strings"])
+def test_classification_metrics_match_sklearn(labels):
+    expected, obtained = _classification_inputs(labels)
+
+    computed = deployments._compute_metrics(CLASSIFICATION_METRICS, expected, obtained)
+
+    # Metrics sklearn refuses, the binary ones without pos_label=1 among two labels or for multiclass, are left out
+    assert computed == pytest.approx(_sklearn_metrics(CLASSIFICATION_METRICS, expected, obtained))
+
+
+def test_regression_metrics_match_sklearn():
+    rng = np.random.default_rng(0)
+    expected = rng.uniform(0, 10, size=200)
+    obtained = expected + rng.normal(size=200)
+
+    computed = deployments._compute_metrics(REGRESSION_METRICS, expected, obtained)
+
+    assert computed["rmse"] == pytest.approx(np.sqrt(computed["mse"]))
+    assert computed == pytest.approx(_sklearn_metrics(REGRESSION_METRICS, expected, obtained))
+
+
+def test_msle_of_negative_targets_is_left_out():
+    computed = deployments._compute_metrics(["mse", "msle", "rmsle"], np.array([-2.0, 1.0]), np.array([0.5, 1.0]))
+
+    assert set(computed) == {"mse"}
+
+
+def _bootstrap_indexes(rows, resamples, seed):
+    return np.random.default_rng(seed).integers(0, rows, size=(resamples, rows))
+
+
+@pytest.mark.parametrize("labels", [[0, 1], [0, 1, 2]], ids=["binary", "multiclass"])
+def test_bootstrap_replicates_match_sklearn(labels):
+    expected, obtained = _classification_inputs(labels, rows=50)
+    names = ["accuracy", "balanced_accuracy", "kappa", "mcc"] + (["f1", "precision", "recall"] if len(labels) == 2 else [])
+
+    replicates = deployments._bootstrap_replicates(names, expected, obtained, 20, 7, deployments.time.time() + 60)
+
+    for i, index in enumerate(_bootstrap_indexes(50, 20, 7)):
+        expected_metrics = _sklearn_metrics(names, expected[index], obtained[index])
+        assert {name: replicates[name][i] for name in expected_metrics} == pytest.approx(expected_metrics)
+
+
+def test_regression_bootstrap_replicates_match_sklearn():
+    rng = np.random.default_rng(0)
+    expected = rng.uniform(2, 10, size=50)
+    obtained = expected + rng.normal(size=50)
+
+    replicates = deployments._bootstrap_replicates(REGRESSION_METRICS, expected, obtained, 20, 7, deployments.time.time() + 60)
+
+    for i, index in enumerate(_bootstrap_indexes(50, 20, 7)):
+        expected_metrics = _sklearn_metrics(REGRESSION_METRICS, expected[index], obtained[index])
+        assert {name: replicates[name][i] for name in REGRESSION_METRICS} == pytest.approx(expected_metrics)
+
+
+def test_bootstrap_counts_the_resamples_computed(monkeypatch):
+    monkeypatch.setattr(deployments, "BOOTSTRAP_CHUNK_ELEMENTS", 100)
+    monkeypatch.setattr(deployments, "BOOTSTRAP_RESAMPLES", 30)
+    expected, obtained = _classification_inputs([0, 1], rows=10)
+
+    intervals = deployments._bootstrap_confidence_intervals(["accuracy", "roc_auc", "cm"], expected, obtained)
+
+    assert set(intervals) == {"accuracy"}
+    assert intervals["accuracy"]["resamples"] == 30
+    assert intervals["accuracy"]["lower"] <= deployments._compute_metrics(["accuracy"], expected, obtained)["accuracy"] <= intervals["accuracy"]["upper"]
+    assert deployments._bootstrap_replicates(["accuracy"], expected, obtained, 30, 0, deployments.time.time() - 1) == {}
+
+
+def test_cancelled_venv_build_kills_pip_and_removes_the_venv(monkeypatch):
+    processes, removed = [], []
+    create_subprocess_shell = asyncio.create_subprocess_shell
+
+    async def build_slowly(command, **kwargs):
+        processes.append(await create_subprocess_shell("sleep 30 & wait", **kwargs))
+        return processes[0]
+    monkeypatch.setattr(asyncio, "create_subprocess_shell", build_slowly)
+    monkeypatch.setattr(deployments.shutil, "rmtree", lambda path, ignore_errors=False: removed.append(path))
+
+    async def cancel_build():
+        task = asyncio.create_task(deployments._build_model_venv("model", "1"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel_build())
+    assert processes[0].returncode == -9
+    assert removed == ["/app/models/model-1/venv"]
+
+
+def test_log_payload_is_redacted_and_truncated(monkeypatch):
+    body = b'{"instances": [[1, 2]], "Password": "hunter2", "nested": {"token": "abc"}}'
+
+    assert str(deployments._LogPayload(body)) == '{"instances": [[1, 2]], "Password": "[redacted]", "nested": {"token": "[redacted]"}}'
+
+    monkeypatch.setattr(deployments, "LOG_PAYLOAD_MAX_CHARS", 5)
+    assert str(deployments._LogPayload(np.arange(100))) == "[0, 1...[truncated]"
+    assert str(deployments._LogPayload(b"not json")) == "not j...[truncated]"
+
+
+def test_sampled_logger_keeps_every_warning():
+    sampled = deployments._SampledLogger(deployments.logger, 0.0)
+
+    assert not sampled.isEnabledFor(deployments.logging.INFO)
+    assert sampled.isEnabledFor(deployments.logging.WARNING)
+
+
+def _export_frames():
+    return [
+        pd.DataFrame({"a": [1, 2], "b": [None, None]}),
+        pd.DataFrame({"a": [2.5], "b": ["x"], "c": [{"nested": 1}]}),
+    ]
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_columnar_export_round_trip(export_format):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    schema = deployments._columnar_schema(_export_frames())
+    closed = []
+
+    content = b"".join(deployments._stream_columnar_dataset(_export_frames(), export_format, schema, on_close=lambda: closed.append(True)))
+
+    if export_format == "parquet":
+        table = pq.read_table(io.BytesIO(content))
+    else:
+        table = pa.ipc.open_stream(content).read_all()
+    assert table.schema == pa.schema([("a", pa.float64()), ("b", pa.string()), ("c", pa.string())])
+    assert table.to_pylist() == [
+        {"a": 1.0, "b": None, "c": None},
+        {"a": 2.0, "b": None, "c": None},
+        {"a": 2.5, "b": "x", "c": '{"nested": 1}'},
+    ]
+    assert closed == [True]
+
+
+def test_csv_export_has_the_columns_of_every_batch():
+    columns = deployments._columnar_schema(_export_frames()).names
+
+    content = "".join(deployments._stream_csv_dataset(_export_frames(), columns))
+
+    assert pd.read_csv(io.StringIO(content)).columns.tolist() == ["a", "b", "c"]
+    assert len(pd.read_csv(io.StringIO(content))) == 3
+
+
+def test_window_datasets_are_slices_of_one_pass(monkeypatch):
+    monkeypatch.setattr(deployments, "_get_mongo_database", lambda: (type("Client", (), {"close": lambda self: None})(), None))
+    queried = []
+
+    def batches(db, model_name, version, timestamp_range=None):
+        queried.append(timestamp_range)
+        # Buckets come after the raw documents, out of capture order
+        yield pd.DataFrame({"a": [3]}), np.array(["2024-01-03"], dtype="datetime64[us]"), np.array([1.0])
+        yield pd.DataFrame({"a": [1, 2]}), np.array(["2024-01-01", "2024-01-02"], dtype="datetime64[us]"), np.array([1.0, 1.0])
+    monkeypatch.setattr(deployments, "_iter_captured_batches", batches)
+
+    windows = deployments._load_window_datasets("model", "1", {"week": datetime(2024, 1, 2), "month": datetime(2024, 1, 1)})
+
+    assert queried == [{"$gte": datetime(2024, 1, 1)}]
+    assert windows["week"]["a"].tolist() == [2, 3]
+    assert windows["month"]["a"].tolist() == [1, 2, 3]
+
+
+def test_weighted_resample_follows_the_weights():
+    df = pd.DataFrame({"a": [0, 1]})
+
+    assert deployments._weighted_resample(df, np.array([2.0, 2.0])) is df
+    assert deployments._weighted_resample(df, np.array([0.0, 1.0]))["a"].tolist() == [1, 1]
+
+
+def test_decode_predictions():
+    assert deployments._decode_predictions(b'{"predictions": [0, 1]}') == [0, 1]
+    assert deployments._decode_predictions(b'[[0.2, 0.8]]') == [[0.2, 0.8]]
+    assert deployments._decode_predictions(b"\xff not json") is None
+
+
+def test_invocation_is_captured_with_its_prediction_and_latency(monkeypatch):
+    monkeypatch.setattr(deployments, "INPUTED_DATA_STORAGE_MODE", "raw")
+    inserted = []
+
+    def insert_one(document):
+        inserted.append(document)
+        return type("InsertOneResult", (), {"inserted_id": 1})()
+    db = type("Database", (), {"inputed_data": type("Collection", (), {"insert_one": staticmethod(insert_one)})()})()
+    monkeypatch.setattr(deployments, "_get_mongo_database", lambda: (type("Client", (), {"close": lambda self: None})(), db))
+
+    deployments._save_inputed_data_to_mongo("model", "1", b'{"instances": [[1, 2]]}', request_id="id", response_content=b'{"predictions": [1]}', status_code=200, latency_ms=12.5)
+
+    (document,) = inserted
+    assert document["data"] == {"instances": [[1, 2]]}
+    assert (document["request_id"], document["predictions"], document["status_code"], document["latency_ms"]) == ("id", [1], 200, 12.5)
+    assert isinstance(document["timestamp"], datetime)
+
+
+def test_merged_label_stats_describe_like_one_batch():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 3, 50).tolist()
+    predictions = rng.integers(0, 3, 50).tolist()
+
+    merged = deployments._merge_label_stats(
+        deployments._label_stats(labels[:20], predictions[:20], True, True),
+        deployments._label_stats(labels[20:], predictions[20:], True, True),
+    )
+    combined = deployments._describe_label_stats(deployments._label_stats(labels, predictions, True, True))
+    described = deployments._describe_label_stats(merged)
+
+    assert described["count"] == 50
+    assert described["classification"] == combined["classification"]
+    assert described["regression"] == pytest.approx(combined["regression"])
+
+
+def test_label_regression_metrics_match_sklearn():
+    metrics = pytest.importorskip("sklearn.metrics")
+    rng = np.random.default_rng(1)
+    labels = rng.uniform(1, 10, 40)
+    predictions = labels + rng.normal(0, 1, 40)
+
+    regression = deployments._describe_label_stats(deployments._label_stats(labels.tolist(), predictions.tolist(), False, True))["regression"]
+
+    assert regression["mse"] == pytest.approx(metrics.mean_squared_error(labels, predictions))
+    assert regression["mae"] == pytest.approx(metrics.mean_absolute_error(labels, predictions))
+    assert regression["mape"] == pytest.approx(metrics.mean_absolute_percentage_error(labels, predictions))
+    assert regression["r2"] == pytest.approx(metrics.r2_score(labels, predictions))
+    assert regression["explained_variance"] == pytest.approx(metrics.explained_variance_score(labels, predictions))
+
+
+def test_signature_examples():
+    assert [deployments._signature_example(name) for name in ("DataType.integer", "DataType.binary", "int32", "bool", "float64")] == [42, "ZGF0YQ==", 42, True, 3.14159]
+
+
+def test_warmup_instances_from_the_signature():
+    rows, source = deployments._warmup_instances("model", "1", [
+        {"name": "a", "type": "DataType.integer", "shape": None},
+        {"name": "b", "type": "DataType.string", "shape": None},
+    ])
+    assert source == "signature"
+    assert rows(2) == [{"a": 42, "b": "hello world"}] * 2
+
+    rows, _source = deployments._warmup_instances("model", "1", [{"name": None, "type": "float32", "shape": [-1, 2, -1]}])
+    assert rows(1) == [[[3.14159], [3.14159]]]
+
+
+def _profile_request(body, token=None):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    headers = [(b"x-admin-token", token.encode())] if token is not None else []
+    return Request({"type": "http", "headers": headers}, receive)
+
+
+@pytest.mark.parametrize("admin_token, token, status_code", [("", None, 403), ("", "secret", 403), ("secret", None, 401), ("secret", "wrong", 401)])
+def test_profiler_needs_the_admin_token(monkeypatch, admin_token, token, status_code):
+    monkeypatch.setattr(deployments, "ADMIN_TOKEN", admin_token)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(deployments.profile_service(_profile_request(b'{"seconds": 0.1}', token)))
+    assert error.value.status_code == status_code
+
+
+def test_profiler_returns_collapsed_stacks(monkeypatch):
+    monkeypatch.setattr(deployments, "ADMIN_TOKEN", "secret")
+
+    response = asyncio.run(deployments.profile_service(_profile_request(b'{"seconds": 0.1, "interval_ms": 5, "include_idle": true}', "secret")))
+
+    assert response.headers["x-profile-requests"] == "0"
+    assert int(response.headers["x-profile-samples"]) > 0
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in response.body.decode().splitlines())
+    assert deployments.active_profile is None
+
+
+def test_importing_the_api_loads_no_heavy_module():
+    code = "import sys, deployments; print(sorted(m for m in ('pandas', 'numpy', 'pyarrow', 'pymongo', 'sklearn', 'mlflow') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(deployments.__file__), capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_lazy_module_replaces_itself_on_first_use(monkeypatch):
+    loads = []
+
+    def load():
+        loads.append(True)
+        return io
+    monkeypatch.setattr(deployments, "lazy_io", deployments._Lazy("lazy_io", load), raising=False)
+
+    assert deployments.lazy_io.BytesIO is io.BytesIO
+    assert deployments.lazy_io is io
+    assert deployments._Lazy("lazy_io", load)._load() is io
+    assert loads == [True]
+
+
+def test_failed_startup_phase_is_recorded(monkeypatch):
+    monkeypatch.setattr(deployments, "startup_phases", {})
+
+    def fail():
+        raise RuntimeError("MongoDB is down")
+
+    asyncio.run(deployments._startup_phase("check_mongo", fail))
+
+    assert deployments.startup_phases["check_mongo"]["status"] == "failed"
+    assert deployments.startup_phases["check_mongo"]["error"] == "MongoDB is down"
+
+
+class _UptimeKuma:
+    def __init__(self, monitors):
+        self.monitors = monitors
+        self.calls = []
+
+    def get_monitors(self):
+        self.calls.append(("get_monitors",))
+        return [dict(monitor) for monitor in self.monitors]
+
+    def add_monitor(self, type, name, url):
+        self.calls.append(("add_monitor", name, url))
+        return {"monitorID": 10}
+
+    def edit_monitor(self, monitor_id, url):
+        self.calls.append(("edit_monitor", monitor_id, url))
+
+    def delete_monitor(self, monitor_id):
+        self.calls.append(("delete_monitor", monitor_id))
+
+
+def test_monitor_reconciliation(monkeypatch):
+    prefix = deployments.MONITOR_URL_PREFIX
+    monkeypatch.setattr(deployments, "uptime_kuma_api", type("UptimeKumaApi", (), {"MonitorType": type("MonitorType", (), {"HTTP": "http"})}))
+    monkeypatch.setattr(deployments, "deployed_models", {
+        "a-1": {"model_name": "a", "version": "1"},
+        "b-2": {"model_name": "b", "version": "2"},
+    })
+    api = _UptimeKuma([
+        {"id": 1, "name": "a version 1", "url": f"{prefix}a-1/old"},
+        {"id": 2, "name": "c version 1", "url": f"{prefix}c-1/health"},
+        {"id": 3, "name": "website", "url": "https://example.com"},
+    ])
+    sync = deployments._MonitorSync()
+    sync._api = api
+
+    assert sync.reconcile() == (["b version 2"], ["a version 1"], ["c version 1"])
+    assert api.calls == [
+        ("get_monitors",),
+        ("edit_monitor", 1, f"{prefix}a-1/health"),
+        ("add_monitor", "b version 2", f"{prefix}b-2/health"),
+        ("delete_monitor", 2),
+    ]
+
+    # The cached monitor list is up to date, a run without changes sends nothing
+    api.calls.clear()
+    assert sync.reconcile() == ([], [], [])
+    assert api.calls == []
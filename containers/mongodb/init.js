@@ -1,2 +1,3 @@
 db = db.getSiblingDB('mlflow');
-db.init.insertOne({created: true, timestamp: new Date()});
\ No newline at end of file
+db.init.insertOne({created: true, timestamp: new Date()});
+db.inputed_data.createIndex({model_name: 1, version: 1, timestamp: 1}, {name: 'model_name_version_timestamp'});
@@ -10,8 +10,36 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-import requests
+import httpx
 import io
+import time
+
+MODEL_DEPLOYMENT_URL = "http://model_deployment:8000"
+# Loaded before the settings below are read
+load_dotenv("./remote_logs.env")
+# Reports generated at the same time by model_deployment, delivery is not limited
+MAX_CONCURRENT_REPORTS = int(os.getenv("MAX_CONCURRENT_REPORTS", 4))
+REPORT_TIMEOUT_SECONDS = float(os.getenv("REPORT_TIMEOUT_SECONDS", 1800))
+REPORT_JOB_POLL_SECONDS = float(os.getenv("REPORT_JOB_POLL_SECONDS", 5))
+
+
+def send_email(email_address, zip_content, service_name):
+    msg = MIMEMultipart()
+    msg["From"] = os.getenv("EMAIL_SENDER_ADDRESS")
+    msg["To"] = email_address
+    msg["Subject"] = "MLflow Degradation Report"
+    msg.attach(MIMEText(f"Please find attached the degradation report for {service_name}", "plain"))
+
+    # Attach zip file
+    part = MIMEBase('application', 'octet-stream')
+    part.set_payload(zip_content)
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', f'attachment; filename="{service_name}_report.zip"')
+    msg.attach(part)
+
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+        server.login(msg["From"], os.getenv("EMAIL_SENDER_TOKEN"))
+        server.sendmail(msg["From"], msg["To"], msg.as_string())
 
 
 async def send_message_to_subscribers(zip_content, service_name):
@@ -29,60 +57,142 @@ async def send_message_to_subscribers(zip_content, service_name):
                             WHERE users.id=subcriptions.user_id and services.id=subcriptions.service_id
                                 and service_name=? and subcriptions.uses_telegram
                        """, (service_name,))
-        for (user_id,) in cursor:
-            try:
-                await bot.send_document(chat_id=user_id, document=zip_file, caption=f"Degradation report for {service_name}")
-                zip_file.seek(0)  # Reset file pointer for next send
-            except Exception as e:
-                print(f"Failed to send to {user_id}: {e}")
+        telegram_users = [user_id for (user_id,) in cursor]
 
         cursor.execute("""SELECT users.email_address 
                             FROM users, services, subcriptions
                             WHERE users.id=subcriptions.user_id and services.id=subcriptions.service_id
                                 and service_name=? and subcriptions.uses_email
                        """, (service_name,))
-        for (email_address,) in cursor:
-            msg = MIMEMultipart()
-            msg["From"] = os.getenv("EMAIL_SENDER_ADDRESS")
-            msg["To"] = email_address
-            msg["Subject"] = "MLflow Degradation Report"
-            msg.attach(MIMEText(f"Please find attached the degradation report for {service_name}", "plain"))
-
-            # Attach zip file
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(zip_content)
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename="{service_name}_report.zip"')
-            msg.attach(part)
-
-            try:
-                with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                    server.login(msg["From"], os.getenv("EMAIL_SENDER_TOKEN"))
-                    server.sendmail(msg["From"], msg["To"], msg.as_string())
-            except Exception as e:
-                print(f"Failed to send email to {email_address}: {e}")
+        email_addresses = [email_address for (email_address,) in cursor]
 
-if __name__ == "__main__":
-    response = requests.get("http://model_deployment:8000/get_deployed_models")
-
-    models = []
-    if response.status_code == 200:
-        data = response.json()
-        for key, model_info in data.items():
-            model_name = model_info["model_name"]
-            version = model_info["version"]
-            models.append((model_name, version))    
-    else:
-        print(response.text)
-        sys.exit(1)
-
-    if not models:
-        print("No deployed models found.")
-        sys.exit(0)
-
-    for model_name, version in models:
-        zip_response = requests.get(f"http://model_deployment:8000//model/{model_name}-{version}/degradation_report")
-        if zip_response.status_code == 200:
-            asyncio.run(send_message_to_subscribers(zip_response.content, f"degradation_report_{model_name}_{version}"))
+    failures = 0
+    for user_id in telegram_users:
+        try:
+            zip_file.seek(0)  # Reset file pointer for every send
+            await bot.send_document(chat_id=user_id, document=zip_file, caption=f"Degradation report for {service_name}")
+        except Exception as e:
+            failures += 1
+            print(f"Failed to send to {user_id}: {e}")
+
+    # smtplib blocks, so emails are sent from threads to keep the other reports going
+    results = await asyncio.gather(
+        *(asyncio.to_thread(send_email, email_address, zip_content, service_name) for email_address in email_addresses),
+        return_exceptions=True
+    )
+    for email_address, result in zip(email_addresses, results):
+        if isinstance(result, Exception):
+            failures += 1
+            print(f"Failed to send email to {email_address}: {result}")
+
+    return len(telegram_users) + len(email_addresses) - failures, failures
+
+
+async def wait_for_report_job(http_client, job_id):
+    """
+    Poll a degradation report job until it is no longer running, returns its final status.
+    """
+    while True:
+        response = await http_client.get(f"{MODEL_DEPLOYMENT_URL}/degradation_report/jobs/{job_id}")
+        response.raise_for_status()
+        job = response.json()
+        if job["status"] != "running":
+            return job
+        await asyncio.sleep(REPORT_JOB_POLL_SECONDS)
+
+
+async def get_current_report(http_client, model_name, version):
+    """
+    Get the degradation report of the current data, not the previous report served while the new one is built.
+    """
+    url = f"{MODEL_DEPLOYMENT_URL}/model/{model_name}-{version}/degradation_report"
+    zip_response = await http_client.get(url, params={"wait": "true"})
+    # Services without the wait option answer right away with the previous report and the job building the current one
+    if zip_response.status_code == 200 and zip_response.headers.get("X-Report-Stale") == "true":
+        job = await wait_for_report_job(http_client, zip_response.headers["X-Report-Job"])
+        if job["status"] != "done":
+            raise RuntimeError(f"Report job {job['id']} {job['status']}: {job.get('error')}")
+        zip_response = await http_client.get(url, params={"wait": "true"})
+    return zip_response
+
+
+async def handle_model_report(http_client, semaphore, model_name, version):
+    """
+    Get the degradation report of a model and send it to its subscribers, returns the timings and outcome.
+    """
+    result = {
+        "model": f"{model_name}-{version}",
+        "status": "ok",
+        "generation_seconds": None,
+        "delivery_seconds": None,
+        "sent": 0,
+        "failed_sends": 0,
+        "error": None,
+    }
+    try:
+        start = time.perf_counter()
+        async with semaphore:
+            zip_response = await get_current_report(http_client, model_name, version)
+        result["generation_seconds"] = time.perf_counter() - start
+
+        if zip_response.status_code != 200:
+            result["status"] = "failed"
+            result["error"] = f"HTTP {zip_response.status_code}: {zip_response.text[:200]}"
+            return result
+
+        # Delivery runs outside the semaphore so it overlaps with the generation of the other reports
+        start = time.perf_counter()
+        result["sent"], result["failed_sends"] = await send_message_to_subscribers(
+            zip_response.content, f"degradation_report_{model_name}_{version}"
+        )
+        result["delivery_seconds"] = time.perf_counter() - start
+        if result["failed_sends"]:
+            result["status"] = "partial"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def print_summary(results, elapsed):
+    print(f"Degradation reports for {len(results)} models in {elapsed:.1f}s")
+    for result in results:
+        generation = f"{result['generation_seconds']:.1f}s" if result["generation_seconds"] is not None else "-"
+        delivery = f"{result['delivery_seconds']:.1f}s" if result["delivery_seconds"] is not None else "-"
+        line = (f"  {result['model']}: {result['status']}, generation {generation}, delivery {delivery}, "
+                f"sent {result['sent']}, failed sends {result['failed_sends']}")
+        if result["error"]:
+            line += f", error {result['error']}"
+        print(line)
+
+
+async def main():
+    async with httpx.AsyncClient(timeout=httpx.Timeout(REPORT_TIMEOUT_SECONDS)) as http_client:
+        response = await http_client.get(f"{MODEL_DEPLOYMENT_URL}/get_deployed_models")
+
+        models = []
+        if response.status_code == 200:
+            data = response.json()
+            for key, model_info in data.items():
+                model_name = model_info["model_name"]
+                version = model_info["version"]
+                models.append((model_name, version))    
         else:
-            print(f"Failed to get report for {model_name} v{version}")
\ No newline at end of file
+            print(response.text)
+            return 1
+
+        if not models:
+            print("No deployed models found.")
+            return 0
+
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REPORTS)
+        results = await asyncio.gather(
+            *(handle_model_report(http_client, semaphore, model_name, version) for model_name, version in models)
+        )
+        print_summary(results, time.perf_counter() - start)
+
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+
+import handle_reports
+
+
+def _run_report(handler, monkeypatch):
+    sent = []
+
+    async def send_message_to_subscribers(zip_content, service_name):
+        sent.append((zip_content, service_name))
+        return 1, 0
+
+    monkeypatch.setattr(handle_reports, "send_message_to_subscribers", send_message_to_subscribers)
+    monkeypatch.setattr(handle_reports, "REPORT_JOB_POLL_SECONDS", 0)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            return await handle_reports.handle_model_report(http_client, asyncio.Semaphore(1), "model", "1")
+
+    return asyncio.run(run()), sent
+
+
+def test_current_report_is_sent(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=b"current", headers={"X-Report-Stale": "false"})
+
+    result, sent = _run_report(handler, monkeypatch)
+
+    assert result["status"] == "ok"
+    assert sent == [(b"current", "degradation_report_model_1")]
+    assert requests[0].url.params["wait"] == "true"
+
+
+def test_stale_report_waits_for_the_job(monkeypatch):
+    polls = []
+    reports = iter([
+        httpx.Response(200, content=b"previous", headers={"X-Report-Stale": "true", "X-Report-Job": "job1"}),
+        httpx.Response(200, content=b"current", headers={"X-Report-Stale": "false"}),
+    ])
+
+    def handler(request):
+        if request.url.path == "/degradation_report/jobs/job1":
+            polls.append(request)
+            status = "running" if len(polls) < 3 else "done"
+            return httpx.Response(200, json={"id": "job1", "status": status, "error": None})
+        return next(reports)
+
+    result, sent = _run_report(handler, monkeypatch)
+
+    assert result["status"] == "ok"
+    assert len(polls) == 3
+    assert sent == [(b"current", "degradation_report_model_1")]
+
+
+def test_failed_job_is_not_sent(monkeypatch):
+    def handler(request):
+        if request.url.path == "/degradation_report/jobs/job1":
+            return httpx.Response(200, json={"id": "job1", "status": "failed", "error": "no data"})
+        return httpx.Response(200, content=b"previous", headers={"X-Report-Stale": "true", "X-Report-Job": "job1"})
+
+    result, sent = _run_report(handler, monkeypatch)
+
+    assert result["status"] == "failed"
+    assert "no data" in result["error"]
+    assert sent == []